@@ -0,0 +1,53 @@
+"""
+Grade a whole class set of assignment submissions from the command line.
+
+Usage:
+    python bulk_grade.py SOURCE [--results RESULTS] [--concurrency N]
+
+SOURCE is a directory or zip archive with one sub-directory (or single
+image) per student. Results are appended to RESULTS as JSON lines; running
+the same command again resumes where an interrupted run stopped.
+"""
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from services.bulk_grading_service import BulkGradingJob, DEFAULT_CONCURRENCY
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a class set of assignment submissions")
+    parser.add_argument("source", help="Directory or zip archive of per-student page images")
+    parser.add_argument("--results", help="JSONL file to append results to (default: <source>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of concurrent OpenAI calls")
+    args = parser.parse_args()
+
+    source = args.source.rstrip(os.sep)
+    results_path = args.results or f"{source}.results.jsonl"
+
+    def print_progress(progress):
+        done = progress["completed"] + progress["failed"] + progress["skipped"]
+        print(
+            f"[{done}/{progress['total']}] completed={progress['completed']} "
+            f"failed={progress['failed']} skipped={progress['skipped']}",
+            flush=True
+        )
+
+    job = BulkGradingJob(source, results_path, concurrency=args.concurrency, on_progress=print_progress)
+    progress = job.run()
+
+    if progress["status"] != "completed":
+        print(f"❌ Bulk grading failed: {progress['error']}", file=sys.stderr)
+        return 1
+
+    print(f"✅ Results written to {results_path}")
+    return 0 if progress["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
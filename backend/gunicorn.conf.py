@@ -0,0 +1,9 @@
+"""
+Gunicorn configuration, picked up automatically by `gunicorn main:app`
+"""
+
+
+def post_worker_init(worker):
+    """Warm upstream connections as soon as each worker has loaded the app."""
+    from services.warmup import start_warmup
+    start_warmup()
@@ -84,6 +84,10 @@ if __name__ == "__main__":
     logger.info(f"Starting Someta Math Helper API on port {port}")
     logger.info(f"Debug mode: {app.debug}")
     
+    # Warm upstream connections before the first request
+    from services.warmup import start_warmup
+    start_warmup()
+    
     # Run the application
     app.run(
         host="0.0.0.0",
@@ -0,0 +1,205 @@
+"""
+Offline performance regression checks for the request pipeline.
+
+Replays recorded OpenAI traffic through the message processing and
+submission grading services, and compares per-scenario metrics against a
+stored baseline:
+    upstream_calls   OpenAI requests made by the scenario
+    peak_alloc_kb    Peak Python memory allocated while it runs
+    overhead_ms      Fastest wall time with instant replay, i.e. in-process
+                     overhead; timed in separate runs without tracemalloc
+
+Hedged requests are disabled so every run makes the same upstream calls.
+
+The cassette and baseline live in perf/ and are committed once recorded;
+they are not in the repository until someone records them with a live key.
+
+Usage:
+    python perf_regression.py --record           # live, needs OPENAI_API_KEY
+    python perf_regression.py --update-baseline  # replay and store metrics
+    python perf_regression.py                    # replay and check metrics
+
+Exits with status 1 when a metric grows past its threshold, and 2 when the
+cassette or baseline is missing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+PERF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf")
+CASSETTE_PATH = os.path.join(PERF_DIR, "cassettes", "pipeline.json")
+BASELINE_PATH = os.path.join(PERF_DIR, "baseline.json")
+
+# Allowed growth over the baseline before a metric counts as a regression:
+# (relative growth, absolute floor) so small values do not fail on noise
+THRESHOLDS = {
+    "upstream_calls": (0.0, 0),
+    "peak_alloc_kb": (0.10, 64.0),
+    "overhead_ms": (0.25, 5.0),
+}
+
+# 1x1 PNG used as a submission page
+SAMPLE_PAGE = (
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8/x8AAwMCAO+ip1sAAAAASUVORK5CYII="
+)
+
+SAMPLE_HISTORY = [
+    {"role": "user", "content": "How do I add 2/3 and 1/4?"},
+    {"role": "assistant", "content": "Start by finding a common denominator."},
+]
+
+
+def build_scenarios():
+    """Return the pipeline scenarios to measure, by name."""
+    from models.chat_targets import ChatTarget
+    from services.message_processing_service import MessageProcessingService
+    from services import openai_service, submission_image_service
+
+    # Send grading calls through the cassette-wrapped client as well
+    submission_image_service.client = openai_service.client
+
+    def problem_generation():
+        return asyncio.run(MessageProcessingService.process_problem_generation(
+            content=json.dumps({"interests": "basketball", "standard": "6.RP.A.3"}),
+            messages=[{"role": "system", "content": "You write short math word problems."}],
+            student_id="perf-student",
+            target=ChatTarget("soproby")
+        ))
+
+    def meta_analysis():
+        return asyncio.run(MessageProcessingService.process_meta_analysis(
+            content="",
+            all_histories={"sofeea": SAMPLE_HISTORY, "soproby": SAMPLE_HISTORY, "socrato": SAMPLE_HISTORY},
+            student_id="perf-student",
+            target=ChatTarget("socrato")
+        ))
+
+    def submission():
+        return submission_image_service.process_submission([SAMPLE_PAGE, SAMPLE_PAGE], student_id="perf-student")
+
+    return {
+        "problem_generation": problem_generation,
+        "meta_analysis": meta_analysis,
+        "submission": submission,
+    }
+
+
+def measure(cassette, scenario, runs):
+    """Run a scenario several times and return its metrics."""
+    if cassette.mode == "record":
+        # One pass is enough to capture the traffic
+        calls_before = cassette.upstream_calls
+        scenario()
+        return {"upstream_calls": cassette.upstream_calls - calls_before}
+
+    # Memory and call counts, traced once
+    cassette.rewind()
+    tracemalloc.start()
+    scenario()
+    peak_alloc_kb = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    upstream_calls = cassette.upstream_calls
+
+    # Timing runs without tracemalloc; the fastest run is the least noisy
+    timings = []
+    for _ in range(runs):
+        cassette.rewind()
+        started = time.perf_counter()
+        scenario()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "upstream_calls": upstream_calls,
+        "peak_alloc_kb": round(peak_alloc_kb, 1),
+        "overhead_ms": round(min(timings), 2),
+    }
+
+
+def compare(name, metrics, baseline):
+    """Return a description of each metric that grew past its threshold."""
+    failures = []
+    for metric, (relative, floor) in THRESHOLDS.items():
+        expected = baseline.get(metric)
+        if expected is None:
+            continue
+        limit = max(expected * (1 + relative), expected + floor)
+        if metrics[metric] > limit:
+            failures.append(f"{name}.{metric}: {metrics[metric]} > {limit:.2f} (baseline {expected})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline performance regression checks")
+    parser.add_argument("--record", action="store_true", help="Record a new cassette against the live API")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the measured metrics as the new baseline")
+    parser.add_argument("--runs", type=int, default=5, help="Timing runs per scenario")
+    parser.add_argument("--speed", type=float, default=0, help="Replay speed multiplier; 0 replays instantly")
+    args = parser.parse_args()
+
+    if not args.record and not os.path.exists(CASSETTE_PATH):
+        print(
+            f"❌ No cassette at {CASSETTE_PATH}. Record one first with "
+            f"`python perf_regression.py --record` and a live OPENAI_API_KEY.",
+            file=sys.stderr
+        )
+        return 2
+    if not (args.record or args.update_baseline) and not os.path.exists(BASELINE_PATH):
+        print(
+            f"❌ No baseline at {BASELINE_PATH}. Create one with "
+            f"`python perf_regression.py --update-baseline`.",
+            file=sys.stderr
+        )
+        return 2
+
+    # The cassette layer is configured when the OpenAI clients are created
+    os.environ["OPENAI_CASSETTE"] = CASSETTE_PATH
+    os.environ["OPENAI_CASSETTE_MODE"] = "record" if args.record else "replay"
+    os.environ["OPENAI_CASSETTE_SPEED"] = str(args.speed)
+
+    # Latency samples build up across runs and would start hedged requests,
+    # which make extra calls the cassette has no responses for
+    os.environ["HEDGE_MIN_SAMPLES"] = str(10 ** 9)
+
+    from services.cassette import get_cassette
+
+    scenarios = build_scenarios()
+    cassette = get_cassette()
+
+    results = {name: measure(cassette, scenario, args.runs) for name, scenario in scenarios.items()}
+    for name, metrics in results.items():
+        print(f"{name}: {metrics}")
+
+    if args.record:
+        cassette.save()
+        return 0
+
+    if args.update_baseline:
+        os.makedirs(PERF_DIR, exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Baseline written to {BASELINE_PATH}")
+        return 0
+
+    with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    failures = []
+    for name, metrics in results.items():
+        failures.extend(compare(name, metrics, baseline.get(name, {})))
+
+    if failures:
+        print("❌ Performance regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+
+    print("✅ No performance regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
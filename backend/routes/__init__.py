@@ -31,6 +31,10 @@ app.register_blueprint(test_bp, url_prefix='/api')
 from .message_routes import message_bp
 app.register_blueprint(message_bp)
 
+# Import and register the Chrome extension API blueprint
+from .api.extension import extension_api
+app.register_blueprint(extension_api)
+
 # Print registered routes for debugging
 print("Registered routes:")
 for rule in app.url_map.iter_rules():
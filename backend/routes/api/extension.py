@@ -7,9 +7,15 @@ import logging
 import json
 import base64
 import io
+import threading
+import uuid
+import zipfile
 from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app
 from services.openai_service import process_math_query, process_math_screenshot
+from services.bulk_grading_service import BulkGradingJob, DEFAULT_CONCURRENCY, check_archive
+from services.warmup import get_readiness
+from services.model_router import latency_tracker
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +24,18 @@ logger = logging.getLogger(__name__)
 # Create Blueprint
 extension_api = Blueprint('extension_api', __name__)
 
+# Uploaded class sets and their results are kept here so jobs can resume
+BULK_GRADING_DIR = os.getenv('BULK_GRADING_DIR', os.path.join('data', 'bulk_grading'))
+
+# Class sets already on the server can be graded from here without uploading
+BULK_GRADING_IMPORT_DIR = os.getenv('BULK_GRADING_IMPORT_DIR', os.path.join('data', 'bulk_imports'))
+
+# A class set of photographed pages is far larger than a single screenshot
+BULK_GRADING_MAX_UPLOAD = int(os.getenv('BULK_GRADING_MAX_UPLOAD', 512 * 1024 * 1024))
+
+# Bulk grading jobs running in this worker, by job ID
+bulk_jobs = {}
+
 @extension_api.route('/chat', methods=['POST'])
 def handle_chat():
     """
@@ -64,6 +82,117 @@ def handle_chat():
             'error': str(e)
         }), 500
 
+@extension_api.route('/grade/bulk', methods=['POST'])
+def start_bulk_grading():
+    """
+    Start grading a class set uploaded as a zip archive, or a directory or
+    archive under BULK_GRADING_IMPORT_DIR given as source_path
+    Pass an existing job_id to resume an interrupted job
+    """
+    try:
+        # Must be raised before the form is parsed
+        request.max_content_length = BULK_GRADING_MAX_UPLOAD
+
+        job_id = request.form.get('job_id') or uuid.uuid4().hex
+        if not job_id.isalnum():
+            return jsonify({'success': False, 'error': 'Invalid job_id'}), 400
+
+        job_dir = os.path.join(BULK_GRADING_DIR, job_id)
+        archive_path = os.path.join(job_dir, 'submissions.zip')
+        source_file = os.path.join(job_dir, 'source_path')
+
+        # Never let a client exceed the server's cap on concurrent OpenAI calls
+        concurrency = request.form.get('concurrency', DEFAULT_CONCURRENCY, type=int)
+        concurrency = max(1, min(concurrency, DEFAULT_CONCURRENCY))
+
+        # Lock the job before touching its files; the lock is shared across workers
+        os.makedirs(job_dir, exist_ok=True)
+        job = BulkGradingJob(None, os.path.join(job_dir, 'results.jsonl'), concurrency=concurrency)
+        if not job.acquire():
+            return jsonify({'success': False, 'error': 'Job is already running'}), 409
+
+        started = False
+        try:
+            archive = request.files.get('archive')
+            source_path = request.form.get('source_path')
+            if archive:
+                archive.save(archive_path)
+                source = archive_path
+            elif source_path:
+                import_dir = os.path.realpath(BULK_GRADING_IMPORT_DIR)
+                source = os.path.realpath(os.path.join(import_dir, source_path))
+                if not source.startswith(import_dir + os.sep) or not os.path.exists(source):
+                    return jsonify({'success': False, 'error': 'Invalid source_path'}), 400
+                with open(source_file, 'w', encoding='utf-8') as f:
+                    f.write(source)
+            elif os.path.exists(archive_path):
+                source = archive_path
+            elif os.path.exists(source_file):
+                with open(source_file, 'r', encoding='utf-8') as f:
+                    source = f.read()
+            else:
+                return jsonify({'success': False, 'error': 'No archive or source_path provided'}), 400
+
+            if zipfile.is_zipfile(source):
+                try:
+                    check_archive(source)
+                except ValueError as e:
+                    return jsonify({'success': False, 'error': str(e)}), 400
+
+            job.source = source
+            bulk_jobs[job_id] = job
+            threading.Thread(target=job.run, daemon=True).start()
+            started = True
+        finally:
+            if not started:
+                job.release()
+
+        logger.info(f"Started bulk grading job {job_id}")
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'timestamp': datetime.now().isoformat()
+        }), 202
+
+    except Exception as e:
+        logger.error(f"Error starting bulk grading: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@extension_api.route('/grade/bulk/<job_id>', methods=['GET'])
+def bulk_grading_status(job_id):
+    """
+    Report progress of a bulk grading job and the results recorded so far
+    """
+    if not job_id.isalnum():
+        return jsonify({'success': False, 'error': 'Invalid job_id'}), 400
+
+    results_path = os.path.join(BULK_GRADING_DIR, job_id, 'results.jsonl')
+    job = bulk_jobs.get(job_id)
+    if not job and not os.path.exists(results_path):
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+
+    results = []
+    if os.path.exists(results_path):
+        with open(results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    continue
+
+    # Jobs started by another worker or before a restart only have results
+    progress = job.progress() if job else {'status': 'not_running', 'completed': len(results)}
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'progress': progress,
+        'results': results
+    })
+
 @extension_api.route('/health', methods=['GET'])
 def health_check():
     """
@@ -73,4 +202,19 @@ def health_check():
         'status': 'ok',
         'version': '1.0.0',
         'timestamp': datetime.now().isoformat()
-    }) 
\ No newline at end of file
+    }) 
+
+@extension_api.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness check for the load balancer
+    Returns 503 until every required upstream dependency has been warmed,
+    along with this worker's recent OpenAI latencies per model
+    """
+    ready, dependencies = get_readiness()
+    return jsonify({
+        'status': 'ready' if ready else 'warming',
+        'dependencies': dependencies,
+        'model_latency': latency_tracker.snapshot(),
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
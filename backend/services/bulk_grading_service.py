@@ -0,0 +1,375 @@
+"""
+Service for grading a whole class set of assignment submissions at once.
+
+Submissions are read from a directory or zip archive with one entry per
+student: either a sub-directory of page images, or a single image file for
+a one-page submission. The student ID is the directory or file name.
+
+Each page is decoded, turned upright, downscaled to at most
+BULK_GRADING_MAX_PAGE_DIMENSION pixels and re-encoded as JPEG before it is
+sent, so full-resolution phone photos do not go upstream as-is.
+
+Students are graded concurrently, with all OpenAI calls going through one
+bounded thread pool so the upstream rate limits are respected. Each finished
+student is appended to a JSONL results file, which doubles as the resume
+point if a run is interrupted.
+
+The session-based submission history is only written when the caller passes
+a session. The CLI and the background jobs started by the API have no Flask
+session, so for them the results file is the submission record.
+"""
+
+import base64
+import fcntl
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from services.logger import setup_logger
+from services.submission_history import add_submission_record
+from services.submission_image_service import (
+    analyze_single_page,
+    generate_combined_analysis,
+    extract_grade,
+)
+
+# Set up logger
+logger = setup_logger(__name__)
+
+# Matches the page limit of a single submission
+MAX_PAGES_PER_STUDENT = 3
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+# Longest side and JPEG quality of the page images sent to OpenAI
+MAX_PAGE_DIMENSION = int(os.getenv("BULK_GRADING_MAX_PAGE_DIMENSION", 2048))
+PAGE_JPEG_QUALITY = int(os.getenv("BULK_GRADING_PAGE_JPEG_QUALITY", 85))
+
+# Default number of concurrent OpenAI calls
+DEFAULT_CONCURRENCY = int(os.getenv("BULK_GRADING_CONCURRENCY", 8))
+
+# Limits on what an archive may expand to
+MAX_ARCHIVE_ENTRIES = int(os.getenv("BULK_GRADING_MAX_ARCHIVE_ENTRIES", 1000))
+MAX_EXTRACTED_BYTES = int(os.getenv("BULK_GRADING_MAX_EXTRACTED_BYTES", 2 * 1024 * 1024 * 1024))
+
+
+class JobLockedError(RuntimeError):
+    """Raised when another run of the same bulk grading job holds its lock."""
+
+
+def check_archive(path):
+    """
+    Reject archives that would expand to too many entries or too many bytes.
+
+    Args:
+        path: Path to the zip archive
+
+    Raises:
+        ValueError: If the archive exceeds MAX_ARCHIVE_ENTRIES or MAX_EXTRACTED_BYTES
+    """
+    with zipfile.ZipFile(path) as archive:
+        infos = archive.infolist()
+    if len(infos) > MAX_ARCHIVE_ENTRIES:
+        raise ValueError(f"Archive has {len(infos)} entries; the limit is {MAX_ARCHIVE_ENTRIES}")
+    total = sum(info.file_size for info in infos)
+    if total > MAX_EXTRACTED_BYTES:
+        raise ValueError(f"Archive expands to {total} bytes; the limit is {MAX_EXTRACTED_BYTES}")
+
+
+def collect_submissions(root):
+    """
+    Find the page images for each student under a directory.
+
+    Args:
+        root: Directory containing one sub-directory or image per student
+
+    Returns:
+        dict: Mapping of student ID to a sorted list of page image paths
+    """
+    submissions = {}
+    for name in sorted(os.listdir(root)):
+        if name.startswith('.') or name == '__MACOSX':
+            continue
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            pages = sorted(
+                os.path.join(path, f) for f in os.listdir(path)
+                if f.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            if pages:
+                if len(pages) > MAX_PAGES_PER_STUDENT:
+                    logger.warning(f"Student {name} has {len(pages)} pages; grading the first {MAX_PAGES_PER_STUDENT}")
+                submissions[name] = pages[:MAX_PAGES_PER_STUDENT]
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            submissions[os.path.splitext(name)[0]] = [path]
+    return submissions
+
+
+def encode_page(path):
+    """
+    Decode a page image, downscale it and base64 encode it as JPEG.
+
+    The page is rotated according to its EXIF orientation, so phone photos
+    arrive upright, and the result always matches the image/jpeg label the
+    grading prompts use.
+
+    Args:
+        path: Path to the page image
+
+    Returns:
+        str: The base64 encoded JPEG, or None if the file is not a readable image
+    """
+    try:
+        with Image.open(path) as image:
+            # Let the JPEG decoder skip detail that would be thrown away
+            image.draft("RGB", (MAX_PAGE_DIMENSION, MAX_PAGE_DIMENSION))
+            page = ImageOps.exif_transpose(image).convert("RGB")
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    page.thumbnail((MAX_PAGE_DIMENSION, MAX_PAGE_DIMENSION))
+    buffer = io.BytesIO()
+    page.save(buffer, format="JPEG", quality=PAGE_JPEG_QUALITY, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def load_completed(results_path):
+    """
+    Read the student IDs already graded in a previous run.
+
+    Args:
+        results_path: Path to the JSONL results file
+
+    Returns:
+        set: Student IDs with a recorded result
+    """
+    completed = set()
+    if not os.path.exists(results_path):
+        return completed
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                completed.add(json.loads(line)["student_id"])
+            except (ValueError, KeyError):
+                # A partially written last line from an interrupted run
+                continue
+    return completed
+
+
+class BulkGradingJob:
+    """A bulk grading run over a class set, with progress reporting and resume."""
+
+    def __init__(self, source, results_path, concurrency=DEFAULT_CONCURRENCY,
+                 session_obj=None, session_id=None, on_progress=None):
+        """
+        Args:
+            source: Directory or zip archive of per-student page images
+            results_path: JSONL file results are appended to
+            concurrency: Maximum number of concurrent OpenAI calls
+            session_obj: Optional session to also record submissions in; only
+                usable when run synchronously within the request
+            session_id: Session ID for history
+            on_progress: Optional callback receiving the progress dict
+        """
+        self.source = source
+        self.results_path = results_path
+        self.concurrency = max(1, concurrency)
+        self.session_obj = session_obj
+        self.session_id = session_id
+        self.on_progress = on_progress
+
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.status = "pending"
+        self.error = None
+        self._lock = threading.Lock()
+        self._lock_path = f"{results_path}.lock"
+        self._lock_file = None
+
+    def acquire(self):
+        """
+        Take the job's exclusive lock, shared across worker processes.
+
+        Returns:
+            bool: False if another run of this job already holds it
+        """
+        lock_file = open(self._lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def release(self):
+        """Release the job's lock if it is held."""
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def progress(self):
+        """Return the current progress of the job."""
+        with self._lock:
+            return {
+                "status": self.status,
+                "total": self.total,
+                "completed": self.completed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "error": self.error,
+            }
+
+    def _report(self):
+        if self.on_progress:
+            self.on_progress(self.progress())
+
+    def run(self):
+        """
+        Grade every student in the source that has no recorded result yet.
+
+        Takes the job's lock unless the caller already holds it, and releases
+        it when done.
+
+        Returns:
+            dict: The final progress of the job
+        """
+        temp_dir = None
+        try:
+            if self._lock_file is None and not self.acquire():
+                raise JobLockedError("This job is already running")
+
+            self.status = "running"
+            root = self.source
+            if zipfile.is_zipfile(self.source):
+                check_archive(self.source)
+                temp_dir = tempfile.mkdtemp(prefix="bulk_grading_")
+                with zipfile.ZipFile(self.source) as archive:
+                    archive.extractall(temp_dir)
+                root = temp_dir
+                # Archives usually wrap everything in a single top-level folder
+                entries = [e for e in os.listdir(root) if e != '__MACOSX']
+                if len(entries) == 1 and os.path.isdir(os.path.join(root, entries[0])):
+                    root = os.path.join(root, entries[0])
+
+            submissions = collect_submissions(root)
+            done = load_completed(self.results_path)
+            pending = {sid: pages for sid, pages in submissions.items() if sid not in done}
+
+            with self._lock:
+                self.total = len(submissions)
+                self.skipped = len(submissions) - len(pending)
+            logger.info(f"Bulk grading {len(pending)} of {len(submissions)} students from {self.source}")
+            self._report()
+
+            if pending:
+                self._grade_all(pending)
+
+            self.status = "completed"
+        except Exception as e:
+            logger.error(f"Error in bulk grading: {str(e)}", exc_info=True)
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            self.release()
+
+        self._report()
+        return self.progress()
+
+    def _grade_all(self, pending):
+        """Grade students concurrently on a thread pool."""
+        # Student workers read their pages and coordinate; every OpenAI call
+        # goes through page_pool, which bounds the concurrent upstream calls
+        with ThreadPoolExecutor(max_workers=self.concurrency) as page_pool, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as student_pool:
+
+            futures = {
+                student_pool.submit(self._grade_student, student_id, pages, page_pool): student_id
+                for student_id, pages in pending.items()
+            }
+
+            for future in as_completed(futures):
+                student_id = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    logger.error(f"Error grading student {student_id}: {str(e)}", exc_info=True)
+                    record = None
+
+                with self._lock:
+                    if record is None:
+                        self.failed += 1
+                    else:
+                        self.completed += 1
+                self._report()
+
+    def _grade_student(self, student_id, pages, page_pool):
+        """
+        Grade a single student's submission and record the result.
+
+        Returns:
+            dict: The recorded result, or None if grading failed
+        """
+        # A partial grade would be recorded as final and skipped on resume,
+        # so any page that fails makes the whole student fail
+        images = [encode_page(path) for path in pages]
+        if not all(images):
+            logger.error(f"Could not read every page image for student {student_id}")
+            return None
+
+        analysis_futures = [
+            page_pool.submit(analyze_single_page, image, i + 1)
+            for i, image in enumerate(images)
+        ]
+        page_analyses = [f.result() for f in analysis_futures]
+        if not all(page_analyses):
+            logger.error(f"Not every page analysis was generated for student {student_id}")
+            return None
+
+        combined_result = page_pool.submit(generate_combined_analysis, page_analyses, len(images)).result()
+        if not combined_result:
+            return None
+
+        record = {
+            "student_id": student_id,
+            "grade": extract_grade(combined_result),
+            "analysis": combined_result,
+            "pages_submitted": len(images),
+            "graded_at": datetime.now().isoformat(),
+        }
+        self._record(record)
+        return record
+
+    def _record(self, record):
+        """Append a result to the results file and the submission history."""
+        with self._lock:
+            with open(self.results_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+
+            if self.session_obj is not None and self.session_id:
+                add_submission_record(
+                    self.session_obj,
+                    self.session_id,
+                    record["student_id"],
+                    record["grade"],
+                    record["analysis"],
+                    pages_submitted=record["pages_submitted"],
+                    submission_type="assignment"
+                )
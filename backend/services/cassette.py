@@ -0,0 +1,311 @@
+"""
+Record/replay layer for OpenAI HTTP traffic.
+
+Wraps the httpx transport used by the OpenAI clients. In record mode every
+request is forwarded upstream and stored alongside its response, including
+each streamed chunk and when it arrived. In replay mode responses are served
+from the cassette file without touching the network, either at the recorded
+speed or accelerated.
+
+Configured through environment variables read when the clients are created:
+    OPENAI_CASSETTE        Path of the cassette file; unset disables the layer
+    OPENAI_CASSETTE_MODE   "record" or "replay" (default "replay")
+    OPENAI_CASSETTE_SPEED  Replay speed multiplier; 0 replays instantly
+"""
+
+import asyncio
+import atexit
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+OPENAI_CASSETTE = os.getenv("OPENAI_CASSETTE")
+OPENAI_CASSETTE_MODE = os.getenv("OPENAI_CASSETTE_MODE", "replay")
+OPENAI_CASSETTE_SPEED = float(os.getenv("OPENAI_CASSETTE_SPEED", 1))
+
+# Headers that differ between runs and are not worth storing
+_VOLATILE_HEADERS = {"date", "set-cookie", "openai-organization", "x-request-id", "cf-ray"}
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+def fingerprint(request: httpx.Request) -> str:
+    """
+    Identify a request by its method, path and canonical JSON body.
+
+    Headers (including the API key) are not part of the fingerprint.
+    """
+    body = request.content or b""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        pass
+    digest = hashlib.sha256()
+    digest.update(request.method.encode("utf-8"))
+    digest.update(b" ")
+    digest.update(request.url.raw_path)
+    digest.update(b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class Cassette:
+    """A set of recorded interactions, shared by every client in the process."""
+
+    def __init__(self, path: str, mode: str = "replay", speed: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.interactions: List[Dict[str, Any]] = []
+        self.upstream_calls = 0
+        self._queues: Dict[str, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+        if mode == "replay":
+            with open(path, "r", encoding="utf-8") as f:
+                self.interactions = json.load(f)["interactions"]
+            self.rewind()
+
+    def rewind(self) -> None:
+        """Reset replay so each recorded interaction can be served again."""
+        with self._lock:
+            self._queues.clear()
+            for interaction in self.interactions:
+                self._queues[interaction["fingerprint"]].append(interaction)
+            self.upstream_calls = 0
+
+    def next_interaction(self, request: httpx.Request) -> Dict[str, Any]:
+        """Return the next recorded response for a request, in recorded order."""
+        key = fingerprint(request)
+        with self._lock:
+            self.upstream_calls += 1
+            queue = self._queues.get(key)
+            if not queue:
+                raise CassetteMissError(f"No recorded response for {request.method} {request.url.path} ({key[:12]})")
+            return queue.popleft()
+
+    def add(self, interaction: Dict[str, Any]) -> None:
+        """Store a recorded interaction."""
+        with self._lock:
+            self.upstream_calls += 1
+            self.interactions.append(interaction)
+
+    def save(self) -> None:
+        """Write all recorded interactions to the cassette file."""
+        if self.mode != "record":
+            return
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "interactions": self.interactions}, f, indent=1)
+        logger.info(f"Saved {len(self.interactions)} interactions to {self.path}")
+
+
+def _start_interaction(request: httpx.Request, response: httpx.Response) -> Dict[str, Any]:
+    return {
+        "fingerprint": fingerprint(request),
+        "request": {
+            "method": request.method,
+            "path": request.url.path,
+            "body": (request.content or b"").decode("utf-8", errors="replace"),
+        },
+        "response": {
+            "status_code": response.status_code,
+            "headers": [
+                [name, value] for name, value in response.headers.multi_items()
+                if name.lower() not in _VOLATILE_HEADERS
+            ],
+            "chunks": [],
+        },
+    }
+
+
+def _replay_response(interaction: Dict[str, Any], stream: httpx.SyncByteStream) -> httpx.Response:
+    recorded = interaction["response"]
+    return httpx.Response(
+        recorded["status_code"],
+        headers=[(name, value) for name, value in recorded["headers"]],
+        stream=stream,
+    )
+
+
+def _delays(interaction: Dict[str, Any], speed: float):
+    """Yield (seconds to wait, chunk bytes) for each recorded chunk."""
+    previous = 0.0
+    for offset, data in interaction["response"]["chunks"]:
+        wait = (offset - previous) / speed if speed > 0 else 0.0
+        previous = offset
+        yield wait, base64.b64decode(data)
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, interaction: Dict[str, Any], speed: float):
+        self.interaction = interaction
+        self.speed = speed
+
+    def __iter__(self):
+        for wait, chunk in _delays(self.interaction, self.speed):
+            if wait > 0:
+                time.sleep(wait)
+            yield chunk
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, interaction: Dict[str, Any], speed: float):
+        self.interaction = interaction
+        self.speed = speed
+
+    async def __aiter__(self):
+        for wait, chunk in _delays(self.interaction, self.speed):
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield chunk
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, inner, cassette: Cassette, interaction: Dict[str, Any], started: float):
+        self.inner = inner
+        self.cassette = cassette
+        self.interaction = interaction
+        self.started = started
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.inner:
+            self.interaction["response"]["chunks"].append(
+                [time.perf_counter() - self.started, base64.b64encode(chunk).decode("ascii")]
+            )
+            yield chunk
+
+    def close(self):
+        self.inner.close()
+        if not self.closed:
+            self.closed = True
+            self.cassette.add(self.interaction)
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner, cassette: Cassette, interaction: Dict[str, Any], started: float):
+        self.inner = inner
+        self.cassette = cassette
+        self.interaction = interaction
+        self.started = started
+        self.closed = False
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            self.interaction["response"]["chunks"].append(
+                [time.perf_counter() - self.started, base64.b64encode(chunk).decode("ascii")]
+            )
+            yield chunk
+
+    async def aclose(self):
+        await self.inner.aclose()
+        if not self.closed:
+            self.closed = True
+            self.cassette.add(self.interaction)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """Sync transport that records to or replays from a cassette."""
+
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.BaseTransport] = None):
+        self.cassette = cassette
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.cassette.mode == "replay":
+            interaction = self.cassette.next_interaction(request)
+            return _replay_response(interaction, _ReplayStream(interaction, self.cassette.speed))
+
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        interaction = _start_interaction(request, response)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, self.cassette, interaction, started),
+            extensions=response.extensions,
+        )
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Async transport that records to or replays from a cassette."""
+
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.cassette.mode == "replay":
+            interaction = self.cassette.next_interaction(request)
+            return _replay_response(interaction, _AsyncReplayStream(interaction, self.cassette.speed))
+
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        interaction = _start_interaction(request, response)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_AsyncRecordingStream(response.stream, self.cassette, interaction, started),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Return the process-wide cassette, or None if the layer is disabled."""
+    global _cassette
+    if not OPENAI_CASSETTE:
+        return None
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette(OPENAI_CASSETTE, OPENAI_CASSETTE_MODE, OPENAI_CASSETTE_SPEED)
+                logger.info(f"Using OpenAI cassette {OPENAI_CASSETTE} in {OPENAI_CASSETTE_MODE} mode")
+                atexit.register(_cassette.save)
+    return _cassette
+
+
+def transport_kwargs(limits: httpx.Limits) -> Dict[str, Any]:
+    """Keyword arguments for a sync httpx client, with the cassette if enabled."""
+    cassette = get_cassette()
+    if cassette is None:
+        return {"limits": limits}
+    return {"transport": CassetteTransport(cassette, httpx.HTTPTransport(limits=limits))}
+
+
+def async_transport_kwargs(limits: httpx.Limits) -> Dict[str, Any]:
+    """Keyword arguments for an async httpx client, with the cassette if enabled."""
+    cassette = get_cassette()
+    if cassette is None:
+        return {"limits": limits}
+    return {"transport": AsyncCassetteTransport(cassette, httpx.AsyncHTTPTransport(limits=limits))}
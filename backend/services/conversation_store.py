@@ -0,0 +1,216 @@
+"""
+Server-side conversation store for chat histories.
+
+Each conversation is keyed by student and chat target and kept as an
+append-only log. Every appended message is written to a JSONL file on local
+disk (the cold tier); recently used conversations are also cached in a
+memory-bounded LRU hot tier.
+
+Clients send only the new message together with the conversation ID and
+the sequence number they expect it to get, instead of the whole history.
+A reset appends a marker to the log; history before the last marker is
+kept on disk but no longer part of the conversation.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Where conversation logs are written and how much history stays in memory
+CONVERSATION_STORE_DIR = os.getenv("CONVERSATION_STORE_DIR", os.path.join("data", "conversations"))
+CONVERSATION_HOT_TIER_BYTES = int(os.getenv("CONVERSATION_HOT_TIER_BYTES", 64 * 1024 * 1024))
+
+# Log entry that starts a new conversation; it takes up one sequence number
+RESET_MARKER = {"reset": True}
+
+
+class SequenceMismatchError(ValueError):
+    """Raised when a client's sequence number does not match the stored log."""
+
+    def __init__(self, conversation_id: str, expected: int, received: int):
+        self.conversation_id = conversation_id
+        self.expected = expected
+        self.received = received
+        super().__init__(
+            f"Sequence mismatch for conversation {conversation_id}: "
+            f"expected {expected}, received {received}"
+        )
+
+
+class _HotEntry:
+    """Cached messages of a conversation and how much of its file they cover."""
+
+    __slots__ = ("messages", "offset")
+
+    def __init__(self):
+        self.messages: List[Dict[str, Any]] = []
+        self.offset = 0
+
+
+class ConversationStore:
+    """
+    Append-only conversation logs with an LRU hot tier and on-disk cold tier.
+
+    The JSONL files are the source of truth and may be shared by several
+    worker processes. Before a cached log is used, any lines other workers
+    appended since it was read are loaded, and appends hold an exclusive
+    file lock so they are serialized across processes.
+    """
+
+    def __init__(self, storage_dir: str = CONVERSATION_STORE_DIR, max_hot_bytes: int = CONVERSATION_HOT_TIER_BYTES):
+        self.storage_dir = storage_dir
+        self.max_hot_bytes = max_hot_bytes
+        self._hot: "OrderedDict[str, _HotEntry]" = OrderedDict()
+        self._hot_bytes = 0
+        self._lock = threading.RLock()
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+    @staticmethod
+    def conversation_id_for(student_id: str, target: str) -> str:
+        """Derive the stable conversation ID for a student and chat target."""
+        key = f"{student_id}\x1f{target}".encode("utf-8")
+        return hashlib.sha256(key).hexdigest()[:32]
+
+    def _path_for(self, conversation_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{conversation_id}.jsonl")
+
+    def _read_new_lines(self, entry: _HotEntry, f) -> None:
+        """Load complete lines written past the entry's offset in an open file."""
+        f.seek(entry.offset)
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                entry.messages.append(json.loads(line))
+        entry.offset += end
+        self._hot_bytes += end
+
+    def _load(self, conversation_id: str, f=None) -> _HotEntry:
+        """
+        Return the up-to-date log for a conversation, promoting it into the hot tier.
+
+        Args:
+            conversation_id: ID of the conversation
+            f: The conversation file already opened for binary reading, if any
+        """
+        entry = self._hot.get(conversation_id)
+        if entry is None:
+            entry = self._hot[conversation_id] = _HotEntry()
+        self._hot.move_to_end(conversation_id)
+
+        if f is not None:
+            self._read_new_lines(entry, f)
+        else:
+            path = self._path_for(conversation_id)
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size = 0
+            if size > entry.offset:
+                with open(path, "rb") as f:
+                    self._read_new_lines(entry, f)
+
+        self._evict(keep=conversation_id)
+        return entry
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Drop least recently used conversations until under the memory bound."""
+        while self._hot_bytes > self.max_hot_bytes and len(self._hot) > 1:
+            oldest = next(iter(self._hot))
+            if oldest == keep:
+                self._hot.move_to_end(oldest)
+                continue
+            self._hot_bytes -= self._hot.pop(oldest).offset
+
+    def get_log(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Return a copy of every log entry, including reset markers, by sequence number."""
+        with self._lock:
+            return list(self._load(conversation_id).messages)
+
+    def get_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Return a copy of the messages since the last reset of a conversation."""
+        return messages_since_reset(self.get_log(conversation_id))
+
+    def get_history(self, student_id: str, target: str) -> List[Dict[str, Any]]:
+        """Return a copy of the messages since the last reset for a student and chat target."""
+        return self.get_messages(self.conversation_id_for(student_id, target))
+
+    def next_sequence(self, conversation_id: str) -> int:
+        """Return the sequence number the next appended message will receive."""
+        with self._lock:
+            return len(self._load(conversation_id).messages)
+
+    def reset(self, conversation_id: str) -> int:
+        """
+        Start a new conversation by appending a reset marker.
+
+        Returns:
+            int: The sequence number after the reset
+        """
+        return self.append(conversation_id, [RESET_MARKER])
+
+    def append(self, conversation_id: str, messages: List[Dict[str, Any]], sequence: Optional[int] = None) -> int:
+        """
+        Append messages to a conversation log.
+
+        Args:
+            conversation_id: ID of the conversation to append to
+            messages: New messages, in order
+            sequence: Sequence number the client expects the first message to
+                get. Retries of messages already stored are accepted as-is.
+
+        Returns:
+            int: The sequence number after the append
+        """
+        with self._lock, open(self._path_for(conversation_id), "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                log = self._load(conversation_id, f).messages
+
+                if sequence is not None:
+                    if sequence < len(log) and log[sequence:sequence + len(messages)] == messages:
+                        # Client retried a delta we already stored
+                        return sequence + len(messages)
+                    if sequence != len(log):
+                        raise SequenceMismatchError(conversation_id, len(log), sequence)
+
+                f.write(b"".join(
+                    json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+                    for message in messages
+                ))
+                f.flush()
+
+                # Pick up our own lines so the cached offset stays at end of file
+                return len(self._load(conversation_id, f).messages)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def messages_since_reset(log: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return the messages of a log that follow its last reset marker."""
+    for index in range(len(log) - 1, -1, -1):
+        if log[index] == RESET_MARKER:
+            return log[index + 1:]
+    return log
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Return the process-wide conversation store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore()
+    return _store
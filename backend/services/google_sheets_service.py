@@ -17,11 +17,19 @@ scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/au
 creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
 client_gsheets = gspread.authorize(creds)
 sheet_link = "https://docs.google.com/spreadsheets/d/1k7Xg6UjwP9BaA1vjnX55K0X3gaExF2YSCkNaeRZQ-OQ"
+_sheet = None
+
+# ✅ Open the sheet once and reuse it for every log
+def get_sheet():
+    global _sheet
+    if _sheet is None:
+        _sheet = client_gsheets.open_by_url(sheet_link).sheet1
+    return _sheet
 
 # ✅ Function to Log Conversation with Purpose
 def log_to_sheets(student_id, user_input, ai_response, messageType: MessageType, chatTarget: ChatTarget):
     try:
-        sheet = client_gsheets.open_by_url(sheet_link).sheet1  # Open sheet by URL
+        sheet = get_sheet()
         pacific_tz = pytz.timezone("America/Los_Angeles")
         timestamp = datetime.datetime.now(pacific_tz).strftime("%Y-%m-%d %I:%M:%S %p") 
 
@@ -1,16 +1,22 @@
 """
 Service layer for processing different types of messages.
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import json
+import os
 from models.message_types import MessageType
 from models.chat_targets import ChatTarget
 from models.messages import UserMessage, AssistantMessage
 from services.openai_service import OpenAIService
+from services.conversation_store import get_conversation_store, messages_since_reset, SequenceMismatchError
 from services.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Most stored history sent upstream with a delta-mode turn; system messages always go
+MAX_CONTEXT_MESSAGES = int(os.getenv("MAX_CONTEXT_MESSAGES", 40))
+MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", 48000))
+
 class MessageProcessingService:
     """Service for processing different types of messages."""
     
@@ -58,12 +64,19 @@ class MessageProcessingService:
                 student_id=student_id
             )
             
+            # Record the turn so store-backed meta-analysis sees it
+            request_summary = f"Interests: {interests}\nMath Standard: {standard}"
+            conversation_state = MessageProcessingService._record_turn(
+                student_id, target, request_summary, response
+            )
+            
             return {
                 "status": "success",
                 "message": response,
                 "target": target.value,
                 "message_type": MessageType.GENERATED_PROBLEM.value,
-                "student_id": student_id
+                "student_id": student_id,
+                **conversation_state
             }
             
         except Exception as e:
@@ -98,12 +111,20 @@ class MessageProcessingService:
                 student_id=student_id
             )
             
+            # Record the turn so store-backed meta-analysis sees it; inline
+            # images are too large to keep in the log
+            image_summary = content if content.startswith('http') else "[Image submitted for analysis]"
+            conversation_state = MessageProcessingService._record_turn(
+                student_id, target, image_summary, response
+            )
+            
             return {
                 "status": "success",
                 "message": response,
                 "target": target.value,
                 "message_type": MessageType.IMAGE_ANALYSIS.value,
-                "student_id": student_id
+                "student_id": student_id,
+                **conversation_state
             }
             
         except Exception as e:
@@ -116,10 +137,57 @@ class MessageProcessingService:
         messages: List[Dict[str, str]],
         message_type: MessageType,
         student_id: str,
-        target: ChatTarget
+        target: ChatTarget,
+        conversation_id: Optional[str] = None,
+        sequence: Optional[int] = None
     ) -> Dict[str, Any]:
-        """Process a text-based message."""
+        """
+        Process a text-based message.
+
+        Passing a sequence number (0 on the first turn) or a conversation_id
+        switches to delta mode: messages then holds only the new messages
+        since the client's last turn, and the full history is read from the
+        server-side conversation store. Only the system messages and the most
+        recent turns within MAX_CONTEXT_MESSAGES and MAX_CONTEXT_CHARS are
+        sent upstream. The result carries the conversation_id and the
+        sequence number to send on the next turn. The new messages are
+        stored together with the reply, only once the reply has been
+        generated.
+        """
         try:
+            store = None
+            if conversation_id is not None or sequence is not None:
+                store = get_conversation_store()
+                expected_id = store.conversation_id_for(student_id, target.value)
+                if conversation_id is None:
+                    conversation_id = expected_id
+                elif conversation_id != expected_id:
+                    raise ValueError("Conversation ID does not match student and target")
+
+                history = store.get_log(conversation_id)
+                if sequence is None:
+                    sequence = len(history)
+                reply_index = sequence + len(messages)
+                if reply_index < len(history) and history[sequence:reply_index] == messages:
+                    # Client retried a turn that was already answered
+                    response = history[reply_index]["content"]
+                    return {
+                        "status": "success",
+                        "message": response,
+                        "target": target.value,
+                        "message_type": message_type.value,
+                        "student_id": student_id,
+                        "conversation_id": conversation_id,
+                        "sequence": reply_index + 1
+                    }
+                if sequence != len(history):
+                    raise SequenceMismatchError(conversation_id, len(history), sequence)
+                new_messages = messages
+                messages = MessageProcessingService._trim_context(
+                    messages_since_reset(history) + new_messages,
+                    len(new_messages)
+                )
+
             # Process the message with OpenAI
             response = await OpenAIService.process_message(
                 messages=messages,
@@ -133,7 +201,7 @@ class MessageProcessingService:
                 student_id=student_id
             )
             
-            return {
+            result = {
                 "status": "success",
                 "message": response,
                 "target": target.value,
@@ -141,10 +209,67 @@ class MessageProcessingService:
                 "student_id": student_id
             }
             
+            if store is not None:
+                result["conversation_id"] = conversation_id
+                result["sequence"] = store.append(
+                    conversation_id,
+                    new_messages + [{"role": "assistant", "content": response}],
+                    sequence
+                )
+            
+            return result
+            
         except Exception as e:
             logger.error(f"Error processing text message: {str(e)}")
             raise
     
+    @staticmethod
+    def _record_turn(student_id: str, target: ChatTarget, user_content: str, response: str) -> Dict[str, Any]:
+        """Append a request and its reply to the conversation store."""
+        store = get_conversation_store()
+        conversation_id = store.conversation_id_for(student_id, target.value)
+        sequence = store.append(conversation_id, [
+            {"role": "user", "content": user_content},
+            {"role": "assistant", "content": response}
+        ])
+        return {"conversation_id": conversation_id, "sequence": sequence}
+    
+    @staticmethod
+    def _trim_context(messages: List[Dict[str, Any]], keep_last: int) -> List[Dict[str, Any]]:
+        """Keep the system messages and as many recent turns as fit the context budget."""
+        system_messages = [msg for msg in messages if msg.get("role") == "system"]
+        turns = [msg for msg in messages if msg.get("role") != "system"]
+        
+        kept = []
+        budget = MAX_CONTEXT_CHARS - sum(len(json.dumps(msg)) for msg in system_messages)
+        for index, msg in enumerate(reversed(turns)):
+            budget -= len(json.dumps(msg))
+            if index >= keep_last and (budget < 0 or len(kept) >= MAX_CONTEXT_MESSAGES):
+                break
+            kept.append(msg)
+        
+        return system_messages + kept[::-1]
+    
+    @staticmethod
+    def reset_conversation(student_id: str, target: ChatTarget) -> Dict[str, Any]:
+        """Start a new conversation for a student and chat target."""
+        store = get_conversation_store()
+        conversation_id = store.conversation_id_for(student_id, target.value)
+        return {
+            "conversation_id": conversation_id,
+            "sequence": store.reset(conversation_id)
+        }
+    
+    @staticmethod
+    def get_conversation_state(student_id: str, target: ChatTarget) -> Dict[str, Any]:
+        """Get the conversation ID and next sequence number for a student and chat target."""
+        store = get_conversation_store()
+        conversation_id = store.conversation_id_for(student_id, target.value)
+        return {
+            "conversation_id": conversation_id,
+            "sequence": store.next_sequence(conversation_id)
+        }
+    
     @staticmethod
     def _convert_messages_to_dicts(messages: List[Any]) -> List[Dict[str, Any]]:
         """Convert a list of messages to a list of dictionaries."""
@@ -153,13 +278,26 @@ class MessageProcessingService:
     @staticmethod
     async def process_meta_analysis(
         content: str,
-        all_histories: Dict[str, List[Dict[str, str]]],
+        all_histories: Optional[Dict[str, List[Dict[str, str]]]],
         student_id: str,
         target: ChatTarget,
         messages: List[Dict[str, str]] = None
     ) -> Dict[str, Any]:
-        """Process a meta-analysis request across all chat histories."""
+        """
+        Process a meta-analysis request across all chat histories.
+
+        If all_histories is None, the histories are read from the
+        server-side conversation store instead of the request. The store
+        holds text, problem generation and image analysis turns alike.
+        """
         try:
+            if all_histories is None:
+                store = get_conversation_store()
+                all_histories = {
+                    name: store.get_history(student_id, name)
+                    for name in ('sofeea', 'soproby', 'socrato')
+                }
+            
             # Get the system prompt from messages if available
             system_prompt = next(
                 (msg["content"] for msg in messages if msg["role"] == "system"),
@@ -0,0 +1,235 @@
+"""
+Latency-aware model routing for OpenAI requests.
+
+Provides a local complexity classifier that sends short, simple text
+questions to a faster model tier, rolling per-model latency tracking, and
+hedged requests: when a call runs past the model's recent p95 latency, a
+duplicate request is issued and whichever finishes first wins.
+
+Requests run on one long-lived background event loop per worker, so a
+single async client and its warm connection pool serve every caller
+whichever event loop awaits them, and a hedged loser is really cancelled.
+A token bucket limits hedges to a share of all requests, so an upstream
+slowdown does not double the load.
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Model used for questions the classifier considers simple
+FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+
+# Questions longer than this many characters always go to the default model
+SIMPLE_QUERY_MAX_CHARS = int(os.getenv("SIMPLE_QUERY_MAX_CHARS", 300))
+
+# Conversations whose earlier turns add up to more than this stay on the default model
+SIMPLE_CONTEXT_MAX_CHARS = int(os.getenv("SIMPLE_CONTEXT_MAX_CHARS", 2000))
+
+# Rolling window of latencies kept per model, and samples needed before hedging
+LATENCY_WINDOW = int(os.getenv("MODEL_LATENCY_WINDOW", 200))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+
+# Share of requests that may be hedged, and how many hedges can be saved up
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", 0.1))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", 5))
+
+# Phrases that signal the student needs multi-step reasoning
+_COMPLEX_PATTERNS = re.compile(
+    r"\b(prov\w*|proofs?|why|explain\w*|deriv\w*|step[- ]by[- ]step|show (?:that|how|me)|"
+    r"compar\w*|integra\w*|limits?|matri(?:x|ces)|systems? of equations|word problems?)\b",
+    re.IGNORECASE
+)
+
+# Markup that usually means a long worked expression
+_MATH_MARKUP = re.compile(r"\\[a-zA-Z]+|\$\$|\\\(|\\\[")
+
+
+def is_simple_query(messages: List[Dict[str, Any]]) -> bool:
+    """
+    Decide whether a conversation's latest question can use the fast model.
+
+    A query is simple when every user message is short plain text with no
+    images, no LaTeX and no phrasing that asks for multi-step reasoning, and
+    the earlier turns are short. Short follow-ups such as "I don't get it"
+    partway through a harder problem therefore stay on the default model.
+
+    Args:
+        messages: The chat messages sent to OpenAI
+
+    Returns:
+        bool: True if the fast model tier is suitable
+    """
+    turns = [m for m in messages if m.get("role") != "system"]
+    if not turns or turns[-1].get("role") != "user":
+        return False
+
+    context_chars = 0
+    for message in turns:
+        content = message.get("content")
+        if not isinstance(content, str):
+            # Multi-part content carries images
+            return False
+        context_chars += len(content)
+        if message.get("role") != "user":
+            continue
+        if len(content) > SIMPLE_QUERY_MAX_CHARS:
+            return False
+        if _MATH_MARKUP.search(content) or _COMPLEX_PATTERNS.search(content):
+            return False
+
+    return context_chars - len(turns[-1]["content"]) <= SIMPLE_CONTEXT_MAX_CHARS
+
+
+class LatencyTracker:
+    """Rolling window of request latencies per model."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        """Record the latency of a successful request."""
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, model: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        """
+        Return a latency percentile for a model.
+
+        Returns:
+            float: Latency in seconds, or None with fewer than min_samples samples
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return sample counts and p50/p95/p99 latencies for every model."""
+        with self._lock:
+            counts = {model: len(samples) for model, samples in self._samples.items()}
+        return {
+            model: {
+                "samples": count,
+                "p50": self.percentile(model, 50),
+                "p95": self.percentile(model, 95),
+                "p99": self.percentile(model, 99),
+            }
+            for model, count in counts.items()
+        }
+
+
+class HedgeBudget:
+    """Token bucket that limits hedged requests to a share of all requests."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        """Earn a fraction of a hedge for every request made."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take one hedge from the budget, if there is one."""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+latency_tracker = LatencyTracker()
+hedge_budget = HedgeBudget()
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run_in_background(coro: Awaitable[Any]) -> Future:
+    """
+    Run a coroutine on the worker's background event loop.
+
+    Returns:
+        Future: Cancelling it cancels the coroutine
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="openai-loop", daemon=True).start()
+                _loop = loop
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
+
+
+async def hedged_call(model: str, make_request: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run a request, issuing a duplicate if it runs past the model's p95 latency.
+
+    The first request to succeed wins and the other is cancelled. Hedging only
+    starts once enough latency samples have been collected for the model, and
+    only while the hedge budget allows it.
+
+    Args:
+        model: Model the request is sent to
+        make_request: Creates a new coroutine for the request on each call;
+            it runs on the background loop
+
+    Returns:
+        The result of the first successful request
+    """
+    return await asyncio.wrap_future(run_in_background(_hedged(model, make_request)))
+
+
+async def _hedged(model: str, make_request: Callable[[], Awaitable[Any]]) -> Any:
+    """Run a hedged request on the background loop."""
+    hedge_budget.deposit()
+    threshold = latency_tracker.percentile(model, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    started = {}
+
+    def launch():
+        task = asyncio.ensure_future(make_request())
+        started[task] = time.perf_counter()
+        return task
+
+    pending = {launch()}
+    if threshold is not None:
+        done, _ = await asyncio.wait(pending, timeout=threshold)
+        if not done and hedge_budget.try_spend():
+            logger.info(f"Hedging request to {model} after {threshold:.2f}s")
+            pending.add(launch())
+
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    latency_tracker.record(model, time.perf_counter() - started[task])
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
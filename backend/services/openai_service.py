@@ -1,30 +1,69 @@
 """
 OpenAI service for handling all OpenAI API interactions.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import asyncio
 import os
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 from models.message_types import MessageType
+from services.model_router import FAST_MODEL, is_simple_query, hedged_call
+from services.cassette import OPENAI_CASSETTE, OPENAI_CASSETTE_MODE, transport_kwargs, async_transport_kwargs
 
 # Load environment variables
 load_dotenv()
 
 # Initialize OpenAI client
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+if not OPENAI_API_KEY and OPENAI_CASSETTE and OPENAI_CASSETTE_MODE == "replay":
+    # Replayed responses never reach OpenAI, so no real key is needed
+    OPENAI_API_KEY = "cassette-replay"
 if not OPENAI_API_KEY:
     raise ValueError("❌ Missing OpenAI API key! Check your .env file.")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Keep idle connections open long enough for the warm-up keep-alive to reuse them
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", 120))
+
+OPENAI_HTTP_LIMITS = httpx.Limits(
+    max_connections=1000,
+    max_keepalive_connections=100,
+    keepalive_expiry=OPENAI_KEEPALIVE_SECONDS
+)
+
+client = OpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=DefaultHttpxClient(**transport_kwargs(OPENAI_HTTP_LIMITS))
+)
+
+# Only used on the model router's background loop, which owns its connections
+async_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=DefaultAsyncHttpxClient(**async_transport_kwargs(OPENAI_HTTP_LIMITS))
+)
 
 class OpenAIService:
     """Service for handling OpenAI API interactions."""
     
     @staticmethod
-    def get_model_for_type(message_type: MessageType) -> str:
-        """Get the appropriate model for the message type."""
+    def get_model_for_type(
+        message_type: MessageType,
+        messages: Optional[List[Dict[str, Any]]] = None
+    ) -> str:
+        """
+        Get the appropriate model for the message type.
+
+        Simple text questions are routed to the faster model tier when the
+        messages are given.
+        """
         if message_type == MessageType.META_ANALYSIS:
             return "gpt-4-1106-preview"  # O1 model for meta analysis
+        elif (
+            messages
+            and message_type != MessageType.GENERATED_PROBLEM
+            and is_simple_query(messages)
+        ):
+            return FAST_MODEL
         else:
             return "gpt-4o"
      
@@ -36,16 +75,29 @@ class OpenAIService:
         message_type: MessageType,
         stream: bool = False
     ) -> str:
-        """Process a text message with OpenAI."""
+        """
+        Process a text message with OpenAI.
+
+        Non-streaming requests are hedged when they run past the model's
+        recent p95 latency.
+        """
         try:
-            response = client.chat.completions.create(
-                model=cls.get_model_for_type(message_type),
-                messages=messages,
-                stream=stream
-            )
+            model = cls.get_model_for_type(message_type, messages)
             
             if stream:
-                return response
+                return client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=True
+                )
+            
+            response = await hedged_call(
+                model,
+                lambda: async_client.chat.completions.create(
+                    model=model,
+                    messages=messages
+                )
+            )
             return response.choices[0].message.content
             
         except Exception as e:
@@ -83,4 +135,21 @@ class OpenAIService:
             return response.choices[0].message.content
             
         except Exception as e:
-            raise Exception(f"Error analyzing image with OpenAI: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Error analyzing image with OpenAI: {str(e)}") 
+
+def process_math_query(question: str) -> str:
+    """Answer a text-only math question from the Chrome extension."""
+    try:
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": question}]
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        raise Exception(f"Error processing math query with OpenAI: {str(e)}")
+
+
+def process_math_screenshot(question: str, image_data: str) -> str:
+    """Answer a math question about a base64 encoded screenshot from the Chrome extension."""
+    prompt = question or "Help me understand the math problem in this screenshot."
+    return asyncio.run(OpenAIService.analyze_image(image_data, prompt))
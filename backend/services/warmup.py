@@ -0,0 +1,152 @@
+"""
+Worker warm-up and dependency readiness tracking.
+
+When a worker starts, a background thread opens connections to the upstream
+services and primes the lazily created clients, then keeps the OpenAI
+connections alive with periodic probes. The readiness endpoint reports the
+per-dependency state so the load balancer only routes traffic to workers
+whose required dependencies are warm.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Seconds between keep-alive probes; must stay below OPENAI_KEEPALIVE_SECONDS
+WARMUP_KEEPALIVE_SECONDS = float(os.getenv("WARMUP_KEEPALIVE_SECONDS", 30))
+
+# Probes fail fast instead of inheriting the client's long timeout and retries
+WARMUP_PROBE_TIMEOUT = float(os.getenv("WARMUP_PROBE_TIMEOUT", 5))
+
+# Consecutive failed probes before a warm dependency is marked as failed, so a
+# brief upstream blip does not pull every worker out of rotation at once
+WARMUP_MAX_FAILURES = int(os.getenv("WARMUP_MAX_FAILURES", 3))
+
+
+def _probe_openai():
+    """Open a pooled TLS connection to OpenAI with a cheap authenticated call."""
+    from services.model_router import run_in_background
+    from services.openai_service import client, async_client
+    client.with_options(timeout=WARMUP_PROBE_TIMEOUT, max_retries=0).models.list()
+    # The async client serves the hedged requests on the router's background loop
+    run_in_background(
+        async_client.with_options(timeout=WARMUP_PROBE_TIMEOUT, max_retries=0).models.list()
+    ).result(timeout=WARMUP_PROBE_TIMEOUT + 1)
+
+
+def _probe_google_sheets():
+    """Authorize with Google and open the log sheet."""
+    from services.google_sheets_service import get_sheet
+    get_sheet()
+
+
+# Dependencies checked by warm-up and readiness, by name. Required ones gate
+# readiness; keep-alive ones are re-probed on every cycle, the others only
+# until they are warm. Sheets logging is best-effort and its reads count
+# against the quota shared with the log writes, so it is neither.
+DEPENDENCIES = {
+    "openai": {"probe": _probe_openai, "required": True, "keepalive": True},
+    "google_sheets": {"probe": _probe_google_sheets, "required": False, "keepalive": False},
+}
+
+_state = {
+    name: {"state": "cold", "latency_ms": None, "last_checked": None, "error": None, "consecutive_failures": 0}
+    for name in DEPENDENCIES
+}
+_state_lock = threading.Lock()
+_started = False
+
+
+def check_dependency(name):
+    """
+    Run the probe for a dependency and record its latency and state.
+
+    A warm dependency stays warm until WARMUP_MAX_FAILURES probes in a row
+    have failed; one that has never been warm fails on its first error.
+
+    Args:
+        name: Name of the dependency in DEPENDENCIES
+
+    Returns:
+        bool: True if the probe succeeded
+    """
+    with _state_lock:
+        if _state[name]["state"] == "cold":
+            _state[name]["state"] = "warming"
+
+    start = time.perf_counter()
+    try:
+        DEPENDENCIES[name]["probe"]()
+        error = None
+    except Exception as e:
+        error = str(e)
+    latency_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    with _state_lock:
+        state = _state[name]
+        failures = state["consecutive_failures"] + 1 if error else 0
+        if not error:
+            new_state = "warm"
+        elif state["state"] == "warm" and failures < WARMUP_MAX_FAILURES:
+            new_state = "warm"
+        else:
+            new_state = "error"
+        state.update({
+            "state": new_state,
+            "consecutive_failures": failures,
+            "latency_ms": latency_ms,
+            "last_checked": datetime.now().isoformat(),
+            "error": error,
+        })
+
+    if error:
+        logger.warning(f"Warm-up probe for {name} failed after {latency_ms}ms: {error}")
+    return error is None
+
+
+def _run():
+    """Warm every dependency, then keep the connections alive."""
+    while True:
+        for name, dependency in DEPENDENCIES.items():
+            with _state_lock:
+                warm = _state[name]["state"] == "warm"
+            if dependency["keepalive"] or not warm:
+                check_dependency(name)
+        time.sleep(WARMUP_KEEPALIVE_SECONDS)
+
+
+def start_warmup():
+    """Start the warm-up thread for this worker, once."""
+    global _started
+    with _state_lock:
+        if _started:
+            return
+        _started = True
+    logger.info("Starting dependency warm-up")
+    threading.Thread(target=_run, name="warmup", daemon=True).start()
+
+
+def get_readiness():
+    """
+    Return the warm/cold state and latest probe latency of each dependency.
+
+    Starts the warm-up if nothing has yet, e.g. under servers that do not
+    run the gunicorn hook.
+
+    Returns:
+        tuple: (ready, dependencies) where ready is True if every required
+            dependency is warm
+    """
+    start_warmup()
+    with _state_lock:
+        dependencies = {
+            name: dict(state, required=DEPENDENCIES[name]["required"])
+            for name, state in _state.items()
+        }
+    ready = all(state["state"] == "warm" for state in dependencies.values() if state["required"])
+    return ready, dependencies